@@ -1,6 +1,52 @@
 from string import punctuation
 from collections import defaultdict
+from heapq import nlargest
+from itertools import accumulate
+from array import array
 from abc import ABC, abstractmethod
+from sys import intern
+
+TOP_K_SORT = 'sort'
+TOP_K_HEAP = 'heap'
+
+GROUP_BY_REPO = 'repo'
+GROUP_BY_AUTHOR = 'author'
+
+
+def tokenize(text):
+    """
+    Preprocess text and split it into words.
+
+    :param text: str
+    :return: list of words
+    """
+    # lowering case
+    text = text.lower()
+
+    words = text.split()
+    # removing leading and trailing punctuation
+    return [word.strip(punctuation)
+            for word in words]
+
+
+def get_top_items(items, n, key, algorithm=TOP_K_SORT):
+    """
+    Returns the n largest items according to key, largest first.
+
+    :param items: iterable of (item, count)
+    :param n: how many
+    :param key: key on which to compare items
+    :param algorithm: TOP_K_SORT sorts all items (O(N log N)),
+            TOP_K_HEAP keeps a heap of n items (O(N log n)) which is
+            cheaper when n is much smaller than the number of items
+    :return: list of (item, count)
+    """
+    if algorithm == TOP_K_HEAP:
+        return nlargest(n, items, key=key)
+    if algorithm == TOP_K_SORT:
+        return sorted(items, key=key, reverse=True)[:n]
+    raise ValueError("Invalid top-k algorithm %s. Valid algorithms = %s, %s"
+                     % (algorithm, TOP_K_SORT, TOP_K_HEAP))
 
 
 class Counter:
@@ -18,6 +64,15 @@ class Counter:
         """
         self.item_count[item] = self.item_count[item] + 1
 
+    def _update_counts(self, items):
+        """
+        Increment the count of each of items by 1
+
+        :param items: iterable of items
+        """
+        for item in items:
+            self._update_count(item)
+
     def get_item_count(self):
         return self.item_count
 
@@ -39,6 +94,13 @@ class Counter:
                       key=key,
                       reverse=reverse)
 
+    def get_top_items(self, n, key, algorithm=TOP_K_SORT):
+        """
+        Returns the n largest items according to key, largest first.
+        See L{get_top_items}
+        """
+        return get_top_items(self.item_count.items(), n, key, algorithm)
+
 
 class WordCounter(Counter):
     def _count_words_in_text(self, text):
@@ -48,17 +110,8 @@ class WordCounter(Counter):
 
         :param text: str
         """
-        # lowering case
-        text = text.lower()
-
-        words = text.split()
-        # removing leading and trailing punctuation
-        words = [word.strip(punctuation)
-                 for word in words]
-
         # updating word count dictionary
-        for word in words:
-            self._update_count(word)
+        self._update_counts(tokenize(text))
 
     def process_documents(self, text_documents):
         """
@@ -68,12 +121,12 @@ class WordCounter(Counter):
             doc_text = doc.get_text()
             self._count_words_in_text(doc_text)
 
-    def get_frequent_words(self, n):
+    def get_frequent_words(self, n, algorithm=TOP_K_SORT):
         # count is the key on which to sort. if count is same, the word's alphabetical
         # order is used to sort.
-        sorted_word_counts = self.get_sorted_items(key=lambda wc: (wc[1], wc[0]),
-                                                   reverse=True)
-        return sorted_word_counts[:n]
+        return self.get_top_items(n,
+                                  key=lambda wc: (wc[1], wc[0]),
+                                  algorithm=algorithm)
 
 
 class HourCounter(Counter):
@@ -95,6 +148,8 @@ class HourCounter(Counter):
             self._extract_count_hour_in_datetime(created_at_time)
 
     def get_most_frequent_hour(self):
+        if not self.item_count:
+            return None
         # count is the key on which to sort.
         sorted_hour_counts = self.get_sorted_items(key=lambda hc: hc[1],
                                                    reverse=True)
@@ -103,3 +158,248 @@ class HourCounter(Counter):
         # Does not handle duplicates
         return sorted_hour_counts[0][0]
 
+
+def _intersect(postings, other_postings):
+    """
+    :param postings: sorted list of document ids
+    :param other_postings: sorted list of document ids
+    :return: sorted list of the document ids in both
+    """
+    common = []
+    i = j = 0
+    while i < len(postings) and j < len(other_postings):
+        if postings[i] == other_postings[j]:
+            common.append(postings[i])
+            i += 1
+            j += 1
+        elif postings[i] < other_postings[j]:
+            i += 1
+        else:
+            j += 1
+    return common
+
+
+class WordIndex:
+    """
+    Inverted index from the words of a list of documents to the documents
+    they occur in. Words are split with the same tokenizer as L{WordCounter}.
+
+    Documents get increasing ids in the order they are processed, so each
+    posting list is sorted and is stored as an array of the differences
+    between consecutive ids, along with an array of how many times the word
+    occurs in each of those documents. The words of each document are kept
+    as well, as arrays of word ids and occurrences, so that words can be
+    counted in a subset of the documents by only going through that subset.
+    """
+    def __init__(self):
+        self.documents = []
+        # word -> word id, and word id -> word
+        self.word_ids = {}
+        self.words = []
+        # document id -> (array of word ids, array of occurrences)
+        self.document_words = []
+        # word -> (array of document id deltas, array of occurrences)
+        self.postings = {}
+        # word -> id of the last document appended to its posting list
+        self._last_document_id = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def process_documents(self, text_documents):
+        """
+        Adds documents to the index. Can be called repeatedly as more
+        documents become available.
+
+        :param text_documents: sequence of objects that implement IHasText
+        """
+        for doc in text_documents:
+            document_id = len(self.documents)
+            self.documents.append(doc)
+
+            occurrences = defaultdict(lambda: 0)
+            for word in tokenize(doc.get_text()):
+                occurrences[word] = occurrences[word] + 1
+
+            document_word_ids, document_counts = array('I'), array('I')
+            self.document_words.append((document_word_ids, document_counts))
+            for word, count in occurrences.items():
+                if word not in self.postings:
+                    self.word_ids[word] = len(self.words)
+                    self.words.append(word)
+                    self.postings[word] = (array('I'), array('I'))
+                    delta = document_id
+                else:
+                    delta = document_id - self._last_document_id[word]
+                deltas, counts = self.postings[word]
+                deltas.append(delta)
+                counts.append(count)
+                self._last_document_id[word] = document_id
+                document_word_ids.append(self.word_ids[word])
+                document_counts.append(count)
+
+    def get_posting_list(self, word):
+        """
+        :param word: str
+        :return: sorted list of ids of the documents the word occurs in
+        """
+        if word not in self.postings:
+            return []
+        deltas, _ = self.postings[word]
+        return list(accumulate(deltas))
+
+    def search(self, text, document_ids=None):
+        """
+        Finds the documents that contain every word of text.
+
+        :param text: str
+        :param document_ids: sorted list of ids to restrict the search to.
+                All documents are searched if not given.
+        :return: sorted list of document ids
+        """
+        words = set(tokenize(text))
+        # starting from the shortest posting list keeps the intermediate
+        # results small
+        posting_lists = sorted((self.get_posting_list(word) for word in words),
+                               key=len)
+        if document_ids is not None:
+            posting_lists.insert(0, document_ids)
+        if not posting_lists:
+            return list(range(len(self.documents)))
+
+        matching_ids = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            matching_ids = _intersect(matching_ids, posting_list)
+        return matching_ids
+
+    def filter_by_created_time(self, since=None, until=None):
+        """
+        :param since: L{datetime}. Documents created before it are left out.
+        :param until: L{datetime}. Documents created at or after it are left out.
+        :return: sorted list of ids of documents (that implement IHasCreatedTime)
+                created in the range
+        """
+        return [document_id for document_id, doc in enumerate(self.documents)
+                if (since is None or doc.get_created_time() >= since)
+                and (until is None or doc.get_created_time() < until)]
+
+    def get_documents(self, document_ids):
+        return [self.documents[document_id] for document_id in document_ids]
+
+    def get_frequent_words(self, n, document_ids=None, algorithm=TOP_K_SORT):
+        """
+        Same as L{WordCounter.get_frequent_words}, counted from the index
+        instead of the text of the documents.
+
+        :param n: how many
+        :param document_ids: ids of the documents to count words in.
+                All documents are counted if not given.
+        :param algorithm: see L{get_top_items}
+        :return: list of (word, count)
+        """
+        if document_ids is None:
+            word_counts = [(word, sum(counts))
+                           for word, (_, counts) in self.postings.items()]
+        else:
+            subset_word_counts = defaultdict(lambda: 0)
+            for document_id in document_ids:
+                for word_id, count in zip(*self.document_words[document_id]):
+                    subset_word_counts[word_id] = subset_word_counts[word_id] + count
+            word_counts = [(self.words[word_id], count)
+                           for word_id, count in subset_word_counts.items()]
+        return get_top_items(word_counts,
+                             n,
+                             key=lambda wc: (wc[1], wc[0]),
+                             algorithm=algorithm)
+
+
+class KeyCounter(Counter):
+    """
+    Counter of keys that are already known, such as group keys
+    """
+    def process_documents(self, keys):
+        """
+        :param keys: sequence of hashable keys
+        """
+        self._update_counts(keys)
+
+
+def _repo_group_key(commit):
+    return commit.repo['name']
+
+
+def _author_group_key(commit):
+    return "{name} <{email}>".format(**commit.author)
+
+
+class GroupedCounter:
+    """
+    Word and hour counts of commits, over all of them and per repo and
+    per author.
+
+    Everything is counted in a single pass over the commits: the text of
+    each commit is split into words once and the words are counted overall
+    and in the groups the commit belongs to. Group keys are interned, since the
+    same few repos and authors repeat across many commits.
+    """
+    GROUP_KEYS = {
+        GROUP_BY_REPO: _repo_group_key,
+        GROUP_BY_AUTHOR: _author_group_key,
+    }
+
+    def __init__(self, group_by=(GROUP_BY_REPO, GROUP_BY_AUTHOR)):
+        """
+        :param group_by: which of GROUP_BY_REPO, GROUP_BY_AUTHOR to group by
+        """
+        for grouping in group_by:
+            if grouping not in self.GROUP_KEYS:
+                raise ValueError("Invalid grouping %s. Valid groupings = %s"
+                                 % (grouping, ", ".join(self.GROUP_KEYS)))
+        self.group_by = group_by
+        # counts over all the commits
+        self.word_counter = WordCounter()
+        self.hour_counter = HourCounter()
+        # grouping -> counter of commits per group key
+        self.group_counters = {grouping: KeyCounter() for grouping in group_by}
+        # grouping -> group key -> counter
+        self.word_counters = {grouping: defaultdict(WordCounter) for grouping in group_by}
+        self.hour_counters = {grouping: defaultdict(HourCounter) for grouping in group_by}
+
+    def process_documents(self, commits):
+        """
+        :param commits: sequence of L{Commit} objects
+        """
+        for commit in commits:
+            words = tokenize(commit.get_text())
+            hour = commit.get_created_time().hour
+            self.word_counter._update_counts(words)
+            self.hour_counter._update_count(hour)
+            for grouping in self.group_by:
+                group_key = intern(self.GROUP_KEYS[grouping](commit))
+                self.group_counters[grouping]._update_count(group_key)
+                self.word_counters[grouping][group_key]._update_counts(words)
+                self.hour_counters[grouping][group_key]._update_count(hour)
+
+    def get_largest_groups(self, grouping, n, algorithm=TOP_K_HEAP):
+        """
+        :param grouping: GROUP_BY_REPO or GROUP_BY_AUTHOR
+        :param n: how many
+        :param algorithm: see L{get_top_items}
+        :return: list of (group key, number of commits) of the n groups with
+                the most commits, largest first.
+        """
+        return self.group_counters[grouping].get_top_items(n,
+                                                           key=lambda gc: (gc[1], gc[0]),
+                                                           algorithm=algorithm)
+
+    def get_frequent_words(self, grouping, group_key, n, algorithm=TOP_K_SORT):
+        """
+        Same as L{WordCounter.get_frequent_words} for the commits of a group
+        """
+        return self.word_counters[grouping][group_key].get_frequent_words(n, algorithm=algorithm)
+
+    def get_most_frequent_hour(self, grouping, group_key):
+        """
+        Same as L{HourCounter.get_most_frequent_hour} for the commits of a group
+        """
+        return self.hour_counters[grouping][group_key].get_most_frequent_hour()
@@ -1,12 +1,21 @@
-from .oauth_settings import CLIENT_ID
-from requests_oauthlib import OAuth2Session
-from cached_property import cached_property
+from .oauth_config import CLIENT_ID
 from abc import ABC, abstractmethod
 from datetime import datetime
+import time
+
+try:
+    from functools import cached_property
+except ImportError:
+    # python < 3.8
+    from cached_property import cached_property
 
 USER_INFO_URL = 'https://api.github.com/user'
 EVENTS_INFO_URL = "https://api.github.com/users/{username}/events?page={page}"
 
+# github serves at most 10 pages of 30 events each
+MAX_PAGES = 10
+PAGE_SIZE = 30
+
 
 class IHasText(ABC):
     """
@@ -88,15 +97,41 @@ class GithubApi:
         """
         :param access_token: Access Token obtained after authorizing user
         """
+        # imported here so that importing this module does not load the
+        # oauth/http stack (requests, oauthlib) before it is needed.
+        from requests_oauthlib import OAuth2Session
+        from .cassette import mount_cassette
         self.github_oauth_session = OAuth2Session(client_id=CLIENT_ID,
                                                   token=access_token)
+        # records or replays github responses, if configured
+        mount_cassette(self.github_oauth_session)
+        # value of time.monotonic() by which requests must complete, if any
+        self.deadline = None
+        # whether the deadline cut the last get_recent_commits short
+        self.timed_out = False
+
+    def _get_json(self, url):
+        """
+        GET url and return the json response. If a deadline is set, the
+        request times out when it is reached.
+
+        :param url: url to get
+        :return: decoded json
+        """
+        timeout = None
+        if self.deadline is not None:
+            timeout = self.deadline - time.monotonic()
+            if timeout <= 0:
+                from requests.exceptions import Timeout
+                raise Timeout("Deadline passed before requesting %s" % (url,))
+        return self.github_oauth_session.get(url, timeout=timeout).json()
 
     @cached_property
     def username(self):
         """
         :return: username associated with the access token
         """
-        user_info = self.github_oauth_session.get(USER_INFO_URL).json()
+        user_info = self._get_json(USER_INFO_URL)
         return user_info['login']
 
     def _get_events(self, page):
@@ -108,13 +143,13 @@ class GithubApi:
                 for a total of 300 events.
         :return: list of events
         """
-        if page > 10 or page < 1:
-            raise ValueError("Invalid page number %s. Valid page numbers = 1-10"
-                             %(page,))
+        if page > MAX_PAGES or page < 1:
+            raise ValueError("Invalid page number %s. Valid page numbers = 1-%s"
+                             %(page, MAX_PAGES))
 
         events_info_url = EVENTS_INFO_URL.format(username=self.username,
                                                  page=page)
-        events_info = self.github_oauth_session.get(url=events_info_url).json()
+        events_info = self._get_json(events_info_url)
 
         return events_info
 
@@ -129,7 +164,14 @@ class GithubApi:
         :param n: how many to fetch
         :return: list of L{Commit} objects
         """
-        events_info = self._get_events(page)
+        return self._get_commits_in_events(self._get_events(page), n)
+
+    def _get_commits_in_events(self, events_info, n):
+        """
+        :param events_info: list of events
+        :param n: how many to fetch
+        :return: list of L{Commit} objects pushed in the PushEvents of events_info
+        """
         commit_events_info = [event_info for event_info in events_info
                               if event_info['type'] == 'PushEvent']
         commits = []
@@ -137,30 +179,95 @@ class GithubApi:
         for commit_event_info in commit_events_info:
             if len(commits) >= n:
                 break
-            repo = commit_event_info['repo']
-            created_at = commit_event_info['created_at']
-            commits_payload = commit_event_info['payload']['commits']
-            for commit_payload in commits_payload:
-                commits.append(Commit.parse_api_payload(repo,
-                                                        created_at,
-                                                        commit_payload))
+            commits.extend(self._get_push_event_commits(commit_event_info))
         return commits
 
-    def get_recent_commits(self, n):
+    def _get_push_event_commits(self, push_event_info):
+        """
+        :param push_event_info: a PushEvent from the events API
+        :return: list of L{Commit} objects pushed in the event
+        """
+        repo = push_event_info['repo']
+        created_at = push_event_info['created_at']
+        commits_payload = push_event_info['payload']['commits']
+        return [Commit.parse_api_payload(repo,
+                                         created_at,
+                                         commit_payload)
+                for commit_payload in commits_payload]
+
+    def iter_commits(self, since=None, until=None, start_page=1):
+        """
+        Iterates over the commits made by user, most recent first.
+        Pages are fetched one at a time as the iteration goes on, so only
+        one page of events is held in memory.
+
+        :param since: L{datetime}. If given, stops at the first commit
+                created before it.
+        :param until: L{datetime}. If given, commits created at or after it
+                are skipped.
+        :param start_page: page number to start from
+        :return: generator of (page number, L{Commit} object)
+        """
+        for page in range(start_page, MAX_PAGES + 1):
+            events_info = self._get_events(page)
+            if not events_info:
+                return
+            for event_info in events_info:
+                if event_info['type'] != 'PushEvent':
+                    continue
+                for commit in self._get_push_event_commits(event_info):
+                    created_at = commit.get_created_time()
+                    if until is not None and created_at >= until:
+                        continue
+                    if since is not None and created_at < since:
+                        return
+                    yield page, commit
+
+    def get_recent_commits(self, n, since=None, pages=MAX_PAGES, deadline=None):
         """
         Get the n most recent commits made by user.
 
         :param n: how many
+        :param since: L{datetime}. If given, only commits created at or after
+                it are returned.
+        :param pages: maximum number of pages to fetch
+        :param deadline: value of time.monotonic() by which fetching has to
+                stop. Requests time out when it is reached and the commits
+                found until then are returned, which may be fewer than n.
+                self.timed_out tells whether that happened.
         :return: list of L{Commit} objects
         """
-        valid_pages = range(1, 11)
+        from requests.exceptions import Timeout
+        valid_pages = range(1, min(pages, MAX_PAGES) + 1)
         commits = []
-        for page in valid_pages:
-            page_commits = self._get_commits(page, n-len(commits))
-            commits.extend(page_commits)
-            if len(commits) >= n:
-                break
+        self.deadline = deadline
+        self.timed_out = False
+        try:
+            for page in valid_pages:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.timed_out = True
+                    break
+                try:
+                    events_info = self._get_events(page)
+                except Timeout:
+                    self.timed_out = True
+                    break
+                if not events_info:
+                    # no more events
+                    break
+                page_commits = self._get_commits_in_events(events_info, n-len(commits))
+                if since is not None:
+                    # events are ordered most recent first, so everything after
+                    # the first older commit is older as well.
+                    recent_page_commits = [commit for commit in page_commits
+                                           if commit.get_created_time() >= since]
+                    commits.extend(recent_page_commits)
+                    if len(recent_page_commits) < len(page_commits):
+                        break
+                else:
+                    commits.extend(page_commits)
+                if len(commits) >= n:
+                    break
+        finally:
+            self.deadline = None
         return commits[:n]
-
-
-
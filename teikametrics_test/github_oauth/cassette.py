@@ -0,0 +1,253 @@
+"""
+Record and replay of github API responses.
+
+A cassette file is a sequence of records, appended as responses are
+recorded. Each record is a header with the lengths of the request key and
+of the response, the request key, and the response compressed on its own.
+Replaying memory-maps the file and only reads the headers and keys up
+front; a response is decompressed when it is requested.
+"""
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from threading import Lock
+from base64 import b64encode, b64decode
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+CASSETTE_RECORD = 'record'
+CASSETTE_REPLAY = 'replay'
+
+GITHUB_API_URL = 'https://api.github.com/'
+
+# lengths of the request key and of the compressed response
+RECORD_HEADER = struct.Struct('<II')
+
+# the recorded body is already decoded, so these no longer apply to it
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+def _request_key(request):
+    return "{method} {url}".format(method=request.method, url=request.url)
+
+
+class CassetteReader:
+    """
+    Reads the responses of a cassette file
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the cassette file
+        """
+        with open(path, 'rb') as cassette_file:
+            if os.fstat(cassette_file.fileno()).st_size:
+                self._mmap = mmap.mmap(cassette_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # nothing was recorded, and empty files cannot be memory-mapped
+                self._mmap = b''
+        # request key -> list of (offset, length) of its responses, in the
+        # order they were recorded. Only the record headers and keys are
+        # read, the responses are left compressed.
+        self._offsets = defaultdict(list)
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(self._mmap):
+            key_length, response_length = RECORD_HEADER.unpack_from(self._mmap, offset)
+            key_offset = offset + RECORD_HEADER.size
+            response_offset = key_offset + key_length
+            if response_offset + response_length > len(self._mmap):
+                # incomplete record, being written or cut short
+                break
+            key = self._mmap[key_offset:response_offset].decode()
+            self._offsets[key].append((response_offset, response_length))
+            offset = response_offset + response_length
+
+    def get(self, key, i):
+        """
+        :param key: request key
+        :param i: a request repeated several times gets the response
+                recorded for it the ith time, or the last one recorded.
+        :return: dict of the recorded response
+        """
+        offsets = self._offsets.get(key)
+        if not offsets:
+            raise KeyError(key)
+        offset, length = offsets[min(i, len(offsets) - 1)]
+        return json.loads(zlib.decompress(self._mmap[offset:offset + length]))
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+
+
+@lru_cache(maxsize=None)
+def get_cassette_reader(path):
+    """
+    Cassettes are not modified while they are replayed, so one reader
+    (and one memory map) per file is shared by all the replays.
+    """
+    return CassetteReader(path)
+
+
+class CassetteWriter:
+    """
+    Appends responses to a cassette file. Responses already in the file
+    are kept.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the cassette file
+        """
+        self.path = path
+        self._lock = Lock()
+
+    def add(self, key, response):
+        """
+        Appends a response to the cassette file.
+
+        :param key: request key
+        :param response: dict of the response
+        """
+        key = key.encode()
+        compressed_response = zlib.compress(json.dumps(response).encode())
+        record = RECORD_HEADER.pack(len(key), len(compressed_response)) \
+            + key + compressed_response
+        with self._lock:
+            # a single write to a file opened for appending, so that records
+            # written by other processes are not interleaved with it
+            with open(self.path, 'ab') as cassette_file:
+                cassette_file.write(record)
+
+
+@lru_cache(maxsize=None)
+def get_cassette_writer(path):
+    """
+    One writer per file is shared by all the recordings, so that
+    concurrent requests do not interleave their records.
+    """
+    return CassetteWriter(path)
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    Transport adapter that sends requests through another adapter and
+    records the responses to a cassette.
+    """
+    def __init__(self, path, adapter=None):
+        """
+        :param path: path of the cassette file
+        :param adapter: adapter that actually sends the requests.
+                L{HTTPAdapter} if not given.
+        """
+        super().__init__()
+        self.writer = get_cassette_writer(path)
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = self.adapter.send(request, **kwargs)
+        # reading the content is part of the time the response took
+        content = response.content
+        elapsed = time.perf_counter() - start
+        self.writer.add(_request_key(request), {
+            'status_code': response.status_code,
+            'reason': response.reason,
+            'headers': {name: value for name, value in response.headers.items()
+                        if name.lower() not in DROPPED_HEADERS},
+            'content': b64encode(content).decode(),
+            'elapsed': elapsed,
+        })
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that answers requests with the responses recorded in
+    a cassette, without any network access.
+    """
+    def __init__(self, path, timing_scale=1.0):
+        """
+        :param path: path of the cassette file
+        :param timing_scale: each response is delayed by the time it
+                originally took multiplied by this. 0 replays without delay.
+        """
+        super().__init__()
+        self.reader = get_cassette_reader(path)
+        self.timing_scale = timing_scale
+        # request key -> how many times it was sent
+        self.sent = defaultdict(lambda: 0)
+
+    def send(self, request, **kwargs):
+        key = _request_key(request)
+        try:
+            recorded = self.reader.get(key, self.sent[key])
+        except KeyError:
+            raise ConnectionError("No recorded response for %s" % (key,), request=request)
+        self.sent[key] = self.sent[key] + 1
+
+        if self.timing_scale:
+            delay = recorded['elapsed'] * self.timing_scale
+            timeout = kwargs.get('timeout')
+            if isinstance(timeout, tuple):
+                # (connect timeout, read timeout)
+                timeout = timeout[1]
+            if timeout is not None and delay > timeout:
+                # times out the way the recorded request would have
+                time.sleep(max(timeout, 0))
+                raise ReadTimeout("Replayed response for %s took longer than %s seconds"
+                                  % (key, timeout), request=request)
+            time.sleep(delay)
+
+        response = Response()
+        response.status_code = recorded['status_code']
+        response.reason = recorded['reason']
+        response.headers = CaseInsensitiveDict(recorded['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = b64decode(recorded['content'])
+        response.elapsed = timedelta(seconds=recorded['elapsed'])
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def mount_cassette(session):
+    """
+    Mounts the adapter for the cassette configured in the settings
+    (GITHUB_CASSETTE, GITHUB_CASSETTE_MODE, GITHUB_CASSETTE_TIMING_SCALE)
+    on the github API URL of session. Does nothing if no cassette is configured.
+
+    :param session: L{requests.Session}
+    """
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+    path = getattr(settings, 'GITHUB_CASSETTE', None)
+    if not path:
+        return
+    mode = getattr(settings, 'GITHUB_CASSETTE_MODE', CASSETTE_REPLAY)
+    if mode == CASSETTE_RECORD:
+        adapter = RecordingAdapter(path)
+    elif mode == CASSETTE_REPLAY:
+        if not os.path.isfile(path):
+            raise ImproperlyConfigured("GITHUB_CASSETTE %s does not exist. Record it first "
+                                       "with GITHUB_CASSETTE_MODE=%s" % (path, CASSETTE_RECORD))
+        adapter = ReplayAdapter(path,
+                                timing_scale=getattr(settings, 'GITHUB_CASSETTE_TIMING_SCALE', 1.0))
+    else:
+        raise ImproperlyConfigured("Invalid GITHUB_CASSETTE_MODE %s. Valid modes = %s, %s"
+                                   % (mode, CASSETTE_RECORD, CASSETTE_REPLAY))
+    session.mount(GITHUB_API_URL, adapter)
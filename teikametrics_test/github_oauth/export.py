@@ -0,0 +1,124 @@
+from .api import MAX_PAGES
+from datetime import datetime
+import csv
+import json
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+CONTENT_TYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_CSV: 'text/csv',
+}
+
+CSV_FIELDS = ['sha', 'repo', 'author_name', 'author_email', 'text', 'created_at', 'cursor']
+
+CURSOR_DATETIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+
+def make_cursor(page, commit):
+    """
+    A cursor identifies an exported commit. Exporting again with it resumes
+    right after that commit.
+
+    :param page: page number the commit was found on
+    :param commit: L{Commit} object
+    :return: str
+    """
+    return "{page}:{created_at}:{sha}".format(
+        page=page,
+        created_at=commit.get_created_time().strftime(CURSOR_DATETIME_FORMAT),
+        sha=commit.sha)
+
+
+def parse_cursor(cursor):
+    """
+    :param cursor: str returned by make_cursor
+    :return: (page number, L{datetime} the commit was created at, sha)
+    """
+    try:
+        page, created_at, sha = cursor.split(':')
+        page = int(page)
+        created_at = datetime.strptime(created_at, CURSOR_DATETIME_FORMAT)
+    except ValueError:
+        raise ValueError("Invalid cursor %s" % (cursor,))
+    if page > MAX_PAGES or page < 1:
+        raise ValueError("Invalid cursor %s. Valid page numbers = 1-%s"
+                         % (cursor, MAX_PAGES))
+    return page, created_at, sha
+
+
+def skip_to_cursor(page_commits, cursor):
+    """
+    Skips the commits up to and including the one the cursor points to.
+
+    New events push older ones to later pages, so the commit is looked
+    for from the cursor's page onwards. Commits created after it are
+    skipped, as are the ones pushed at the same time and listed before it.
+
+    :param page_commits: iterable of (page number, L{Commit} object),
+            most recent first
+    :param cursor: str returned by make_cursor
+    :return: generator of (page number, L{Commit} object)
+    """
+    _, cursor_created_at, cursor_sha = parse_cursor(cursor)
+    passed_cursor = False
+    for page, commit in page_commits:
+        if not passed_cursor:
+            created_at = commit.get_created_time()
+            if created_at > cursor_created_at:
+                continue
+            if created_at == cursor_created_at:
+                passed_cursor = commit.sha == cursor_sha
+                continue
+            passed_cursor = True
+        yield page, commit
+
+
+def commit_record(page, commit):
+    """
+    :return: dict with the exported fields of the commit
+    """
+    return {
+        'sha': commit.sha,
+        'repo': commit.repo['name'],
+        'author_name': commit.author['name'],
+        'author_email': commit.author['email'],
+        'text': commit.text,
+        'created_at': commit.get_created_time().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'cursor': make_cursor(page, commit),
+    }
+
+
+def iter_ndjson(page_commits):
+    """
+    :param page_commits: iterable of (page number, L{Commit} object)
+    :return: generator of lines, one json object per commit
+    """
+    for page, commit in page_commits:
+        yield json.dumps(commit_record(page, commit)) + "\n"
+
+
+class _Echo:
+    """
+    File-like object whose write returns what it is given, so that
+    csv.writer can produce one line at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_csv(page_commits):
+    """
+    :param page_commits: iterable of (page number, L{Commit} object)
+    :return: generator of csv lines, a header followed by one line per commit
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_FIELDS)
+    yield writer.writeheader()
+    for page, commit in page_commits:
+        yield writer.writerow(commit_record(page, commit))
+
+
+WRITERS = {
+    FORMAT_NDJSON: iter_ndjson,
+    FORMAT_CSV: iter_csv,
+}
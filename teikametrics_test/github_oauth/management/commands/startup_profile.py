@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from statistics import median
+import subprocess
+import sys
+import time
+
+# Run in a fresh interpreter: boots the WSGI application the way a worker
+# does and serves a single GET request for the path given as argument.
+# Sessions are kept in signed cookies rather than the database.
+BOOT_SCRIPT = """
+import io
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teikametrics_test.settings')
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+# sessions set by the request go to a cookie instead of the database, so
+# that profiling leaves the database untouched
+settings.SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+application = get_wsgi_application()
+environ = {
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': sys.argv[1],
+    'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '8000',
+    'wsgi.input': io.BytesIO(),
+    'wsgi.url_scheme': 'http',
+}
+statuses = []
+response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(response)
+sys.stdout.write(statuses[0])
+"""
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+class Command(BaseCommand):
+    help = "Profiles worker startup: import time per module and the time " \
+           "from starting a worker to its first response."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/github_oauth/authorize',
+                            help="path of the first request")
+        parser.add_argument('--top', type=int, default=20,
+                            help="how many modules to show in the import time breakdown")
+        parser.add_argument('--runs', type=int, default=5,
+                            help="how many workers to start for the benchmark")
+
+    def _run_worker(self, path, python_options=()):
+        """
+        Starts a fresh interpreter that serves one request for path
+
+        :param path: path of the request
+        :param python_options: extra options for the interpreter
+        :return: L{subprocess.CompletedProcess}
+        """
+        return subprocess.run([sys.executable, *python_options, '-c', BOOT_SCRIPT, path],
+                              cwd=settings.BASE_DIR,
+                              capture_output=True,
+                              text=True,
+                              check=True)
+
+    def _import_times(self, path):
+        """
+        :return: list of (module, self time, cumulative time) in microseconds,
+                ordered by self time, largest first.
+        """
+        worker = self._run_worker(path, python_options=('-X', 'importtime'))
+        import_times = []
+        for line in worker.stderr.splitlines():
+            if not line.startswith(IMPORT_TIME_PREFIX):
+                continue
+            self_time, cumulative_time, module = line[len(IMPORT_TIME_PREFIX):].split('|')
+            if not self_time.strip().isdigit():
+                # header line
+                continue
+            import_times.append((module.strip(),
+                                 int(self_time),
+                                 int(cumulative_time)))
+        return sorted(import_times,
+                      key=lambda it: it[1],
+                      reverse=True)
+
+    def _boot_to_first_response(self, path):
+        """
+        :return: (seconds from starting a worker until its first response, status)
+        """
+        start = time.perf_counter()
+        worker = self._run_worker(path)
+        return time.perf_counter() - start, worker.stdout
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1, got %s" % (options['runs'],))
+
+        import_times = self._import_times(path)
+        total = sum(self_time for _, self_time, _ in import_times)
+        self.stdout.write("Import time of %s modules: %.1f ms"
+                          % (len(import_times), total / 1000))
+        self.stdout.write("%10s %12s  %s" % ("self (ms)", "cumul. (ms)", "module"))
+        for module, self_time, cumulative_time in import_times[:options['top']]:
+            self.stdout.write("%10.1f %12.1f  %s"
+                              % (self_time / 1000, cumulative_time / 1000, module))
+
+        timings = []
+        for _ in range(options['runs']):
+            seconds, status = self._boot_to_first_response(path)
+            timings.append(seconds)
+        self.stdout.write("Boot to first response (GET %s -> %s) over %s runs: "
+                          "min %.1f ms, median %.1f ms, max %.1f ms"
+                          % (path, status, len(timings),
+                             min(timings) * 1000,
+                             median(timings) * 1000,
+                             max(timings) * 1000))
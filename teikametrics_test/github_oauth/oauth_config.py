@@ -0,0 +1,11 @@
+try:
+    from .oauth_settings import CLIENT_ID, CLIENT_SECRET, AUTHORIZATION_BASE_URL, TOKEN_URL
+except ImportError:
+    # oauth_settings.py holds the credentials of the github OAuth app and is
+    # created for each setup (see README), never committed. Without it, tokens
+    # that were already obtained can still be used, as in the tests, but
+    # users cannot be authorized.
+    CLIENT_ID = None
+    CLIENT_SECRET = None
+    AUTHORIZATION_BASE_URL = 'https://github.com/login/oauth/authorize'
+    TOKEN_URL = 'https://github.com/login/oauth/access_token'
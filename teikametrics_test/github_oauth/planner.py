@@ -0,0 +1,184 @@
+from .analytics import TOP_K_SORT, TOP_K_HEAP, WordIndex
+from .api import MAX_PAGES, PAGE_SIZE
+from django.core.cache import cache
+from datetime import datetime
+from hashlib import sha256
+import time
+
+DEFAULT_COMMITS_N = 10
+DEFAULT_WORDS_N = 5
+DEFAULT_REPOS_N = 5
+MAX_COMMITS_N = MAX_PAGES * PAGE_SIZE
+MAX_WORDS_N = 50
+MAX_REPOS_N = 50
+
+# seconds a single dashboard request may spend fetching from github
+TIME_BUDGET = 5
+# seconds for which fetched commits are reused
+CACHE_TIMEOUT = 60
+
+# rough number of distinct words contributed by a commit message
+WORDS_PER_COMMIT_ESTIMATE = 3
+# a heap is used for top-k when k is at least this many times smaller
+# than the estimated number of distinct words
+HEAP_RATIO = 8
+
+DATETIME_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%SZ")  # 2020-02-06 or 2020-02-06T12:02:05Z
+
+SOURCE_CACHE = 'cache'
+SOURCE_API = 'api'
+
+
+def parse_datetime(value):
+    """
+    Parses a datetime query parameter
+
+    :param value: str in one of DATETIME_FORMATS
+    :return: L{datetime} object
+    """
+    for datetime_format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format)
+        except ValueError:
+            pass
+    raise ValueError("Invalid datetime %s. Valid formats = %s"
+                     % (value, ", ".join(DATETIME_FORMATS)))
+
+
+class DashboardPlan:
+    """
+    Decides how much work a dashboard request is allowed to do:
+    how long pages may be fetched for, whether recently fetched commits
+    can be reused from the cache, and which top-k algorithm to use for words.
+    """
+    def __init__(self,
+                 commits_n=DEFAULT_COMMITS_N,
+                 words_n=DEFAULT_WORDS_N,
+                 repos_n=DEFAULT_REPOS_N,
+                 since=None,
+                 time_budget=TIME_BUDGET):
+        """
+        :param commits_n: how many recent commits
+        :param words_n: how many frequent words
+        :param repos_n: how many repos to break the commits down by
+        :param since: L{datetime}. If given, only commits created at or after
+                it are considered.
+        :param time_budget: seconds that may be spent fetching commits
+        """
+        if commits_n > MAX_COMMITS_N or commits_n < 1:
+            raise ValueError("Invalid number of commits %s. Valid numbers = 1-%s"
+                             % (commits_n, MAX_COMMITS_N))
+        if words_n > MAX_WORDS_N or words_n < 1:
+            raise ValueError("Invalid number of words %s. Valid numbers = 1-%s"
+                             % (words_n, MAX_WORDS_N))
+        if repos_n > MAX_REPOS_N or repos_n < 1:
+            raise ValueError("Invalid number of repos %s. Valid numbers = 1-%s"
+                             % (repos_n, MAX_REPOS_N))
+        self.commits_n = commits_n
+        self.words_n = words_n
+        self.repos_n = repos_n
+        self.since = since
+        self.time_budget = time_budget
+
+        estimated_words = commits_n * WORDS_PER_COMMIT_ESTIMATE
+        if words_n * HEAP_RATIO <= estimated_words:
+            self.top_k_algorithm = TOP_K_HEAP
+        else:
+            self.top_k_algorithm = TOP_K_SORT
+
+        # set once the plan is executed
+        self.source = None
+        self.partial = False
+
+    @classmethod
+    def from_query_params(cls, query_params, commits_n=None):
+        """
+        Builds a plan from the query parameters commits, words, repos and since.
+        Missing parameters take their default values.
+
+        :param query_params: L{QueryDict} of the request
+        :param commits_n: if given, used instead of the commits parameter
+        :return: L{DashboardPlan} object
+        """
+        try:
+            if commits_n is None:
+                commits_n = int(query_params.get('commits') or DEFAULT_COMMITS_N)
+            words_n = int(query_params.get('words') or DEFAULT_WORDS_N)
+            repos_n = int(query_params.get('repos') or DEFAULT_REPOS_N)
+        except ValueError:
+            raise ValueError("commits, words and repos must be integers")
+        since = query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+        else:
+            since = None
+        return cls(commits_n=commits_n,
+                   words_n=words_n,
+                   repos_n=repos_n,
+                   since=since)
+
+    def _cache_key(self, github_api, kind='commits'):
+        token_hash = sha256(github_api.github_oauth_session.access_token.encode()).hexdigest()
+        return "github_oauth:{kind}:{token}:{since}".format(kind=kind,
+                                                           token=token_hash,
+                                                           since=self.since)
+
+    def get_commits(self, github_api):
+        """
+        Returns the commits the plan asks for, from the cache if a previous
+        request already fetched enough of them, from github otherwise.
+        Pages are fetched until there are enough commits or no more pages,
+        or until the time budget is spent, in which case the plan is marked
+        partial.
+
+        :param github_api: L{GithubApi} object
+        :return: list of L{Commit} objects
+        """
+        cache_key = self._cache_key(github_api)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cached_commits, cached_exhausted = cached
+            # the cache is usable if it has enough commits or if they are all
+            # the commits there are.
+            if len(cached_commits) >= self.commits_n or cached_exhausted:
+                self.source = SOURCE_CACHE
+                return cached_commits[:self.commits_n]
+
+        self.source = SOURCE_API
+        deadline = time.monotonic() + self.time_budget
+        commits = github_api.get_recent_commits(self.commits_n,
+                                                since=self.since,
+                                                deadline=deadline)
+        self.partial = github_api.timed_out and len(commits) < self.commits_n
+        # fewer commits than asked for without running out of time means
+        # there are no more of them
+        exhausted = not github_api.timed_out and len(commits) < self.commits_n
+
+        if cached is None or len(commits) >= len(cached[0]):
+            cache.set(cache_key,
+                      (commits, exhausted),
+                      CACHE_TIMEOUT)
+        return commits
+
+    def get_word_index(self, github_api):
+        """
+        Returns a L{WordIndex} of the commits the plan asks for.
+        The index is cached along with the commits. If the commits only
+        grew since it was built, the new ones are added to it instead of
+        indexing everything again.
+
+        :param github_api: L{GithubApi} object
+        :return: L{WordIndex} object
+        """
+        commits = self.get_commits(github_api)
+        cache_key = self._cache_key(github_api, kind='index')
+        index = cache.get(cache_key)
+        if index is None \
+                or len(index) > len(commits) \
+                or [commit.sha for commit in index.documents] \
+                != [commit.sha for commit in commits[:len(index)]]:
+            index = WordIndex()
+        if len(index) < len(commits):
+            index.process_documents(commits[len(index):])
+            cache.set(cache_key, index, CACHE_TIMEOUT)
+        return index
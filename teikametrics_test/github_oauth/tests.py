@@ -1,7 +1,25 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.http import QueryDict
 from .api import GithubApi, Commit
-from .analytics import WordCounter, HourCounter
+from .analytics import WordCounter, HourCounter, WordIndex, GroupedCounter, \
+    TOP_K_HEAP, TOP_K_SORT, GROUP_BY_REPO, GROUP_BY_AUTHOR
+from .planner import DashboardPlan, SOURCE_API, SOURCE_CACHE
+from .views import OAUTH_TOKEN
+from .cassette import CassetteWriter, CassetteReader, RecordingAdapter, ReplayAdapter, GITHUB_API_URL
+from requests import Session
+from requests.exceptions import ConnectionError, ReadTimeout
+from base64 import b64encode, b64decode
+from datetime import datetime
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
+import json
+import os
+import subprocess
+import sys
+import time
 # Create your tests here.
 
 
@@ -183,6 +201,36 @@ class APITestCase(TestCase):
         ]
         self.assertListEqual(commits, expected_commits)
 
+    @patch.object(GithubApi, '_get_events', mock_get_events)
+    def test_recent_commits_since(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        commits = api.get_recent_commits(10, since=datetime(2020, 2, 28, 8, 0, 0))
+        self.assertListEqual([commit.sha for commit in commits],
+                             ["eb990f5b2979c2a0b4337acd2ee73891391c7944",
+                              "ba0ce1a43cc9abe55630d1d654c2bb38b0a906ce",
+                              "b7aabf47d7447f096e79372c18a1104503eeac84"])
+
+    @patch.object(GithubApi, '_get_events', mock_get_events)
+    def test_recent_commits_past_deadline(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        commits = api.get_recent_commits(10, deadline=0)
+        self.assertListEqual(commits, [])
+
+
+def mock_get_events_first_page(self, page):
+    if page == 1:
+        return APITestCase.mock_get_events(self, page)
+    return []
+
+
+def mock_get_events_fifth_page(self, page):
+    if page == 5:
+        return APITestCase.mock_get_events(self, page)
+    if page < 5:
+        # events other than pushes
+        return APITestCase.mock_get_events(self, page)[4:]
+    return []
+
 
 class CounterTestCase(TestCase):
     def setUp(self):
@@ -217,7 +265,397 @@ class CounterTestCase(TestCase):
         self.assertListEqual(frequent_words,
                              [('update', 2), ('requirements.txt', 1)])
 
+    def test_word_counter_heap(self):
+        wc = WordCounter()
+        wc.process_documents(self.commits)
+        self.assertListEqual(wc.get_frequent_words(3, algorithm=TOP_K_HEAP),
+                             wc.get_frequent_words(3, algorithm=TOP_K_SORT))
+
     def test_hour_counter(self):
         hc = HourCounter()
         hc.process_documents(self.commits)
         self.assertEqual(hc.get_most_frequent_hour(), 8)
+
+    def test_grouped_counter(self):
+        other_commit = Commit(sha="0c1ee3bb6a5e0d1b2a4c9f8e7d6c5b4a39281706",
+                              author={'email': 'octocat@github.com', 'name': 'Octocat'},
+                              repo={'id': 1296269,
+                                    'name': 'octocat/Hello-World',
+                                    'url': 'https://api.github.com/repos/octocat/Hello-World'},
+                              text="Update hello",
+                              created_at="2020-02-27T20:10:00Z")
+        gc = GroupedCounter()
+        gc.process_documents(self.commits + [other_commit])
+        self.assertListEqual(gc.get_largest_groups(GROUP_BY_REPO, 5),
+                             [('makalaaneesh/github-oauth', 3), ('octocat/Hello-World', 1)])
+        self.assertListEqual(gc.get_largest_groups(GROUP_BY_AUTHOR, 1),
+                             [('Aneesh Makala <makalaaneesh@yahoo.com>', 3)])
+
+        wc = WordCounter()
+        wc.process_documents(self.commits)
+        self.assertListEqual(gc.get_frequent_words(GROUP_BY_REPO, 'makalaaneesh/github-oauth', 2),
+                             wc.get_frequent_words(2))
+        self.assertListEqual(gc.get_frequent_words(GROUP_BY_AUTHOR, 'Octocat <octocat@github.com>', 2),
+                             [('update', 1), ('hello', 1)])
+        self.assertEqual(gc.get_most_frequent_hour(GROUP_BY_REPO, 'octocat/Hello-World'), 20)
+
+        wc = WordCounter()
+        wc.process_documents(self.commits + [other_commit])
+        self.assertListEqual(gc.word_counter.get_frequent_words(3), wc.get_frequent_words(3))
+        self.assertEqual(gc.hour_counter.get_most_frequent_hour(), 8)
+
+    def test_word_index(self):
+        index = WordIndex()
+        # indexing incrementally
+        index.process_documents(self.commits[:1])
+        index.process_documents(self.commits[1:])
+        self.assertEqual(len(index), 3)
+        self.assertListEqual(index.get_posting_list('update'), [0, 1])
+        self.assertListEqual(index.get_posting_list('missing'), [])
+
+        wc = WordCounter()
+        wc.process_documents(self.commits)
+        self.assertListEqual(index.get_frequent_words(4), wc.get_frequent_words(4))
+
+    def test_word_index_search(self):
+        index = WordIndex()
+        index.process_documents(self.commits)
+        self.assertListEqual(index.search("update"), [0, 1])
+        self.assertListEqual(index.search("Update doc"), [1])
+        self.assertListEqual(index.search("update initial"), [])
+        self.assertListEqual(index.search(""), [0, 1, 2])
+        self.assertListEqual(index.search("update", document_ids=[1, 2]), [1])
+
+    def test_word_index_filtered(self):
+        index = WordIndex()
+        index.process_documents(self.commits)
+        document_ids = index.filter_by_created_time(since=datetime(2020, 2, 28, 8, 1, 0),
+                                                    until=datetime(2020, 2, 28, 9, 0, 0))
+        self.assertListEqual(document_ids, [1])
+
+        wc = WordCounter()
+        wc.process_documents(index.get_documents(document_ids))
+        self.assertListEqual(index.get_frequent_words(3, document_ids=document_ids),
+                             wc.get_frequent_words(3))
+
+
+class DashboardPlanTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_from_query_params(self):
+        plan = DashboardPlan.from_query_params(QueryDict("commits=300&words=5&since=2020-02-06"))
+        self.assertEqual(plan.commits_n, 300)
+        self.assertEqual(plan.words_n, 5)
+        self.assertEqual(plan.since, datetime(2020, 2, 6))
+        self.assertEqual(plan.top_k_algorithm, TOP_K_HEAP)
+
+    def test_defaults(self):
+        plan = DashboardPlan.from_query_params(QueryDict(""))
+        self.assertEqual(plan.commits_n, 10)
+        self.assertEqual(plan.words_n, 5)
+        self.assertIsNone(plan.since)
+        self.assertEqual(plan.top_k_algorithm, TOP_K_SORT)
+
+    def test_invalid_query_params(self):
+        for query in ("commits=301", "words=0", "commits=ten", "since=yesterday"):
+            with self.assertRaises(ValueError):
+                DashboardPlan.from_query_params(QueryDict(query))
+
+    @patch.object(GithubApi, '_get_events', APITestCase.mock_get_events)
+    def test_get_commits_cached(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        plan = DashboardPlan(commits_n=2)
+        commits = plan.get_commits(api)
+        self.assertEqual(plan.source, SOURCE_API)
+        self.assertFalse(plan.partial)
+
+        plan = DashboardPlan(commits_n=1)
+        self.assertListEqual(plan.get_commits(api), commits[:1])
+        self.assertEqual(plan.source, SOURCE_CACHE)
+
+    @patch.object(GithubApi, '_get_events', APITestCase.mock_get_events)
+    def test_get_commits_larger_after_smaller(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        DashboardPlan(commits_n=2).get_commits(api)
+
+        plan = DashboardPlan(commits_n=15)
+        self.assertEqual(len(plan.get_commits(api)), 15)
+        self.assertEqual(plan.source, SOURCE_API)
+
+    @patch.object(GithubApi, '_get_events', mock_get_events_first_page)
+    def test_get_commits_exhausted_history_cached(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        self.assertEqual(len(DashboardPlan(commits_n=10).get_commits(api)), 4)
+
+        plan = DashboardPlan(commits_n=15)
+        self.assertEqual(len(plan.get_commits(api)), 4)
+        self.assertEqual(plan.source, SOURCE_CACHE)
+
+    def test_get_commits_timeout(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        plan = DashboardPlan(commits_n=2)
+        with patch.object(api.github_oauth_session, 'get', side_effect=ReadTimeout()) as mock_get:
+            self.assertListEqual(plan.get_commits(api), [])
+        self.assertTrue(plan.partial)
+        self.assertGreater(mock_get.call_args.kwargs['timeout'], 0)
+        self.assertLessEqual(mock_get.call_args.kwargs['timeout'], plan.time_budget)
+
+        # the partial result is not reused as complete
+        with patch.object(GithubApi, '_get_events', APITestCase.mock_get_events):
+            self.assertEqual(len(plan.get_commits(api)), 2)
+        self.assertEqual(plan.source, SOURCE_API)
+
+    @patch.object(GithubApi, '_get_events', APITestCase.mock_get_events)
+    def test_get_commits_partial(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        plan = DashboardPlan(commits_n=2, time_budget=0)
+        self.assertListEqual(plan.get_commits(api), [])
+        self.assertTrue(plan.partial)
+
+
+@patch.object(GithubApi, '_get_events', mock_get_events_first_page)
+class ExportTestCase(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session[OAUTH_TOKEN] = dict(access_token="mock_access_token")
+        session.save()
+
+    def _export(self, **query_params):
+        response = self.client.get('/github_oauth/export', query_params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_iter_commits(self):
+        api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        commits = [commit for _, commit in api.iter_commits(until=datetime(2020, 2, 28, 8, 13, 4))]
+        self.assertListEqual([commit.sha for commit in commits],
+                             ["ba0ce1a43cc9abe55630d1d654c2bb38b0a906ce",
+                              "b7aabf47d7447f096e79372c18a1104503eeac84",
+                              "d6f8c9c20c60978bf89d28eed74ecd30d5a284c7"])
+
+    def test_export_ndjson(self):
+        records = [json.loads(line) for line in self._export().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertDictEqual(records[0], {
+            'sha': "eb990f5b2979c2a0b4337acd2ee73891391c7944",
+            'repo': "makalaaneesh/github-oauth",
+            'author_name': "Aneesh Makala",
+            'author_email': "makalaaneesh@yahoo.com",
+            'text': "Update README.md",
+            'created_at': "2020-02-28T08:13:04Z",
+            'cursor': "1:20200228T081304Z:eb990f5b2979c2a0b4337acd2ee73891391c7944",
+        })
+
+    def test_export_csv(self):
+        lines = self._export(format='csv', since='2020-02-28T08:03:00Z').splitlines()
+        self.assertEqual(lines[0], "sha,repo,author_name,author_email,text,created_at,cursor")
+        self.assertEqual(len(lines), 3)
+
+    def test_export_resume_from_cursor(self):
+        records = [json.loads(line) for line in self._export().splitlines()]
+        resumed = [json.loads(line) for line in self._export(cursor=records[1]['cursor']).splitlines()]
+        self.assertListEqual(resumed, records[2:])
+
+    def test_export_invalid_params(self):
+        for query_params in ({'format': 'xml'},
+                             {'since': 'yesterday'},
+                             {'cursor': 'abc'},
+                             {'cursor': '0:20200228T081304Z:x'},
+                             {'cursor': '-3:20200228T081304Z:x'},
+                             {'cursor': '11:20200228T081304Z:x'}):
+            response = self.client.get('/github_oauth/export', query_params)
+            self.assertEqual(response.status_code, 400)
+
+
+@patch.object(GithubApi, '_get_events', mock_get_events_first_page)
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session[OAUTH_TOKEN] = dict(access_token="mock_access_token")
+        session.save()
+
+    def test_search(self):
+        response = self.client.get('/github_oauth/search', {'q': 'README.md', 'words': 2})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertListEqual([commit['sha'] for commit in result['commits']],
+                             ["eb990f5b2979c2a0b4337acd2ee73891391c7944",
+                              "b7aabf47d7447f096e79372c18a1104503eeac84"])
+        self.assertListEqual(result['frequent_words'], [['update', 2], ['readme.md', 2]])
+
+    def test_search_after_dashboard(self):
+        # every one of the 10 pages has 4 commits
+        with patch.object(GithubApi, '_get_events', APITestCase.mock_get_events):
+            response = self.client.get('/github_oauth/dashboard')
+            self.assertEqual(len(response.context['commits']), 10)
+
+            response = self.client.get('/github_oauth/search')
+            self.assertEqual(len(response.json()['commits']), 40)
+
+    def test_search_until(self):
+        response = self.client.get('/github_oauth/search', {'until': '2020-02-28T08:03:00Z'})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([commit['text'] for commit in response.json()['commits']],
+                             ["Update README.md", "Adding requirerments.txt"])
+
+
+@patch.object(GithubApi, '_get_events', mock_get_events_first_page)
+class DashboardTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session[OAUTH_TOKEN] = dict(access_token="mock_access_token")
+        session.save()
+
+    def test_dashboard(self):
+        response = self.client.get('/github_oauth/dashboard', {'commits': 3, 'words': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['commits']), 3)
+        self.assertListEqual(response.context['frequent_words'], [('update', 2), ('readme.md', 2)])
+        self.assertListEqual([(repo['name'], repo['commits_n']) for repo in response.context['repos']],
+                             [('makalaaneesh/github-oauth', 3)])
+
+    def test_default_dashboard(self):
+        response = self.client.get('/github_oauth/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['commits']), 4)
+        self.assertFalse(response.context['partial'])
+
+    @patch.object(GithubApi, '_get_events', mock_get_events_fifth_page)
+    def test_default_dashboard_sparse_history(self):
+        response = self.client.get('/github_oauth/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['commits']), 4)
+        self.assertEqual(response.context['most_frequent_hour'], 8)
+
+    def test_dashboard_invalid_params(self):
+        response = self.client.get('/github_oauth/dashboard', {'repos': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class CassetteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cassette_path = os.path.join(self.tmp_dir.name, 'github.cassette')
+
+        writer = CassetteWriter(self.cassette_path)
+        writer.add("GET https://api.github.com/user",
+                   self._recorded({'login': 'makalaaneesh'}, elapsed=0.05))
+        writer.add("GET https://api.github.com/users/makalaaneesh/events?page=1",
+                   self._recorded(APITestCase.mock_get_events(None, 1)))
+        writer.add("GET https://api.github.com/users/makalaaneesh/events?page=2",
+                   self._recorded([]))
+
+        session = self.client.session
+        session[OAUTH_TOKEN] = dict(access_token="mock_access_token")
+        session.save()
+
+    def _recorded(self, json_content, elapsed=0.0):
+        return {'status_code': 200,
+                'reason': 'OK',
+                'headers': {'Content-Type': 'application/json; charset=utf-8'},
+                'content': b64encode(json.dumps(json_content).encode()).decode(),
+                'elapsed': elapsed}
+
+    def _session(self, adapter):
+        session = Session()
+        session.mount(GITHUB_API_URL, adapter)
+        return session
+
+    def test_replay_dashboard(self):
+        with override_settings(GITHUB_CASSETTE=self.cassette_path,
+                               GITHUB_CASSETTE_TIMING_SCALE=0):
+            response = self.client.get('/github_oauth/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['commits']), 4)
+        self.assertEqual(response.context['most_frequent_hour'], 8)
+
+    def test_replay_timing(self):
+        session = self._session(ReplayAdapter(self.cassette_path, timing_scale=1))
+        start = time.perf_counter()
+        self.assertEqual(session.get("https://api.github.com/user").json(), {'login': 'makalaaneesh'})
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+    def test_replay_timeout(self):
+        session = self._session(ReplayAdapter(self.cassette_path, timing_scale=1))
+        start = time.perf_counter()
+        with self.assertRaises(ReadTimeout):
+            session.get("https://api.github.com/user", timeout=0.01)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.01)
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+    def test_replay_partial(self):
+        # the recorded /user response took 0.05 seconds
+        with override_settings(GITHUB_CASSETTE=self.cassette_path,
+                               GITHUB_CASSETTE_TIMING_SCALE=1):
+            api = GithubApi(access_token=dict(access_token="mock_access_token"))
+        plan = DashboardPlan(commits_n=2, time_budget=0.01)
+        self.assertListEqual(plan.get_commits(api), [])
+        self.assertTrue(plan.partial)
+
+    def test_replay_empty_cassette(self):
+        empty_path = os.path.join(self.tmp_dir.name, 'empty.cassette')
+        open(empty_path, 'wb').close()
+        session = self._session(ReplayAdapter(empty_path, timing_scale=0))
+        with self.assertRaises(ConnectionError):
+            session.get("https://api.github.com/user")
+
+    def test_replay_missing_cassette(self):
+        missing_path = os.path.join(self.tmp_dir.name, 'missing.cassette')
+        with override_settings(GITHUB_CASSETTE=missing_path):
+            with self.assertRaises(ImproperlyConfigured):
+                GithubApi(access_token=dict(access_token="mock_access_token"))
+
+    def test_replay_missing_response(self):
+        session = self._session(ReplayAdapter(self.cassette_path, timing_scale=0))
+        with self.assertRaises(ConnectionError):
+            session.get("https://api.github.com/users/makalaaneesh/events?page=3")
+
+    def test_writers_append(self):
+        path = os.path.join(self.tmp_dir.name, 'shared.cassette')
+        a = CassetteWriter(path)
+        b = CassetteWriter(path)
+        a.add("GET https://api.github.com/user", self._recorded({'login': 'a'}))
+        b.add("GET https://api.github.com/user", self._recorded({'login': 'b'}))
+        reader = CassetteReader(path)
+        self.assertEqual(json.loads(b64decode(reader.get("GET https://api.github.com/user", 0)['content'])),
+                         {'login': 'a'})
+        self.assertEqual(json.loads(b64decode(reader.get("GET https://api.github.com/user", 1)['content'])),
+                         {'login': 'b'})
+        reader.close()
+
+    def test_record(self):
+        recorded_path = os.path.join(self.tmp_dir.name, 'recorded.cassette')
+        session = self._session(RecordingAdapter(recorded_path,
+                                                 adapter=ReplayAdapter(self.cassette_path,
+                                                                       timing_scale=0)))
+        session.get("https://api.github.com/user")
+        session.get("https://api.github.com/users/makalaaneesh/events?page=1")
+
+        session = self._session(ReplayAdapter(recorded_path, timing_scale=0))
+        self.assertEqual(session.get("https://api.github.com/user").json(),
+                         {'login': 'makalaaneesh'})
+        self.assertEqual(session.get("https://api.github.com/users/makalaaneesh/events?page=1").json(),
+                         APITestCase.mock_get_events(None, 1))
+
+
+class StartupTestCase(TestCase):
+    def test_views_import_is_lazy(self):
+        # run in a fresh interpreter, this one has imported everything already
+        script = ("import os, sys, django;"
+                  "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teikametrics_test.settings');"
+                  "django.setup();"
+                  "import github_oauth.views;"
+                  "print('requests_oauthlib' in sys.modules)")
+        output = subprocess.run([sys.executable, '-c', script],
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+    def test_startup_profile_invalid_runs(self):
+        for runs in (0, -1):
+            with self.assertRaises(CommandError):
+                call_command('startup_profile', runs=runs)
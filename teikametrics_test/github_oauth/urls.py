@@ -6,4 +6,6 @@ urlpatterns = [
     path('authorize', views.authorize, name="authorize"),
     path('callback', views.callback, name="callback"),
     path('dashboard', views.dashboard, name="dashboard"),
+    path('export', views.export, name="export"),
+    path('search', views.search, name="search"),
 ]
\ No newline at end of file
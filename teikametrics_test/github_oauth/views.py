@@ -1,8 +1,10 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponseBadRequest, StreamingHttpResponse, JsonResponse
 from .api import GithubApi
-from requests_oauthlib import OAuth2Session
-from .analytics import WordCounter, HourCounter
-from .oauth_settings import CLIENT_ID, CLIENT_SECRET, AUTHORIZATION_BASE_URL, TOKEN_URL
+from .planner import DashboardPlan, parse_datetime, MAX_COMMITS_N
+from .export import WRITERS, CONTENT_TYPES, FORMAT_NDJSON, parse_cursor, skip_to_cursor
+from .analytics import GroupedCounter, GROUP_BY_REPO
+from .oauth_config import CLIENT_ID, CLIENT_SECRET, AUTHORIZATION_BASE_URL, TOKEN_URL
 
 
 OAUTH_STATE = 'oauth_state'
@@ -19,6 +21,7 @@ def authorize(request):
     In this case, we ask the user for access to github API with scope='repo'
     (to include private repos)
     """
+    from requests_oauthlib import OAuth2Session
     github_oauth_session = OAuth2Session(client_id=CLIENT_ID,)
     authorization_url, state = github_oauth_session.authorization_url(AUTHORIZATION_BASE_URL+"?scope=repo")
 
@@ -35,6 +38,7 @@ def callback(request):
 
     Save the access token in the session and redirect to dashboard.
     """
+    from requests_oauthlib import OAuth2Session
     github_oauth_session = OAuth2Session(client_id=CLIENT_ID,
                                          state=request.session[OAUTH_STATE])
     access_token_info = github_oauth_session.fetch_token(token_url=TOKEN_URL,
@@ -48,30 +52,125 @@ def dashboard(request):
     """
     Return data that the user is interested in.
     This will use the access token to fetch resources from the github API
+
+    Query parameters (all optional):
+        commits: how many recent commits (default 10, max 300)
+        words: how many frequent words (default 5, max 50)
+        repos: how many repos to break the commits down by (default 5, max 50)
+        since: only consider commits since this date (2020-02-06 or 2020-02-06T12:02:05Z)
     """
+    try:
+        plan = DashboardPlan.from_query_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
     github_api = GithubApi(access_token=request.session[OAUTH_TOKEN])
 
     # Recent commits
-    commits_n = 10
-    recent_n_commits = github_api.get_recent_commits(commits_n)
-
-    # Frequent words
-    wc = WordCounter()
-    wc.process_documents(recent_n_commits)
-    words_n = 5
-    top_frequent_n_words = wc.get_frequent_words(words_n)
-
-    # Most frequent hour
-    hc = HourCounter()
-    hc.process_documents(recent_n_commits)
-    most_frequent_hour = hc.get_most_frequent_hour()
+    recent_n_commits = plan.get_commits(github_api)
+
+    # Frequent words, most frequent hour and the breakdown by repo,
+    # counted in one pass over the commits
+    gc = GroupedCounter(group_by=(GROUP_BY_REPO,))
+    gc.process_documents(recent_n_commits)
+
+    top_frequent_n_words = gc.word_counter.get_frequent_words(plan.words_n,
+                                                              algorithm=plan.top_k_algorithm)
+    most_frequent_hour = gc.hour_counter.get_most_frequent_hour()
+
+    # for the repos with the most commits
+    repos = [{'name': repo_name,
+              'commits_n': repo_commits_n,
+              'frequent_words': gc.get_frequent_words(GROUP_BY_REPO,
+                                                      repo_name,
+                                                      plan.words_n,
+                                                      algorithm=plan.top_k_algorithm),
+              'most_frequent_hour': gc.get_most_frequent_hour(GROUP_BY_REPO, repo_name)}
+             for repo_name, repo_commits_n in gc.get_largest_groups(GROUP_BY_REPO, plan.repos_n)]
 
     context = {
-        'commits_n' : commits_n,
+        'commits_n' : len(recent_n_commits),
         'commits': recent_n_commits,
-        'words_n': words_n,
+        'words_n': len(top_frequent_n_words),
         'frequent_words' : top_frequent_n_words,
-        'most_frequent_hour' : most_frequent_hour
+        'most_frequent_hour' : most_frequent_hour,
+        'repos': repos,
+        'since': plan.since,
+        'partial': plan.partial,
     }
     return render(request, 'dashboard.html', context)
+
+
+def export(request):
+    """
+    Stream all the commits of the user, most recent first, as NDJSON
+    (one json object per line) or CSV. Pages are fetched from the github API
+    while the response is being written.
+
+    Query parameters (all optional):
+        format: ndjson (default) or csv
+        since: only commits made at or after this date
+        until: only commits made before this date
+        cursor: the cursor of the last commit received, to resume an export
+    """
+    export_format = request.GET.get('format') or FORMAT_NDJSON
+    if export_format not in WRITERS:
+        return HttpResponseBadRequest("Invalid format %s. Valid formats = %s"
+                                      % (export_format, ", ".join(WRITERS)))
+    try:
+        since = parse_datetime(request.GET['since']) if request.GET.get('since') else None
+        until = parse_datetime(request.GET['until']) if request.GET.get('until') else None
+        cursor = request.GET.get('cursor')
+        start_page = parse_cursor(cursor)[0] if cursor else 1
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    github_api = GithubApi(access_token=request.session[OAUTH_TOKEN])
+    page_commits = github_api.iter_commits(since=since,
+                                           until=until,
+                                           start_page=start_page)
+    if cursor:
+        page_commits = skip_to_cursor(page_commits, cursor)
+
+    response = StreamingHttpResponse(WRITERS[export_format](page_commits),
+                                     content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = 'attachment; filename="commits.%s"' % (export_format,)
+    return response
+
+
+def search(request):
+    """
+    Search the recent commits of the user by the words in their messages.
+    Returns json with the matching commits and the most frequent words
+    among them.
+
+    Query parameters (all optional):
+        q: words that the commit message must all contain
+        since: only commits made at or after this date
+        until: only commits made before this date
+        words: how many frequent words (default 5, max 50)
+    """
+    try:
+        plan = DashboardPlan.from_query_params(request.GET, commits_n=MAX_COMMITS_N)
+        until = parse_datetime(request.GET['until']) if request.GET.get('until') else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    github_api = GithubApi(access_token=request.session[OAUTH_TOKEN])
+    index = plan.get_word_index(github_api)
+
+    commit_ids = index.filter_by_created_time(until=until) if until else None
+    commit_ids = index.search(request.GET.get('q', ''), commit_ids)
+    frequent_words = index.get_frequent_words(plan.words_n,
+                                              document_ids=commit_ids,
+                                              algorithm=plan.top_k_algorithm)
+
+    return JsonResponse({
+        'commits': [{'sha': commit.sha,
+                     'repo': commit.repo['name'],
+                     'text': commit.text,
+                     'created_at': commit.get_created_time()}
+                    for commit in index.get_documents(commit_ids)],
+        'frequent_words': frequent_words,
+        'partial': plan.partial,
+    })
@@ -119,3 +119,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Record github API responses to a cassette file, or replay them from it
+# without network access (see github_oauth/cassette.py)
+GITHUB_CASSETTE = os.environ.get('GITHUB_CASSETTE')
+# record or replay
+GITHUB_CASSETTE_MODE = os.environ.get('GITHUB_CASSETTE_MODE', 'replay')
+# replayed responses are delayed by their original time multiplied by this
+GITHUB_CASSETTE_TIMING_SCALE = float(os.environ.get('GITHUB_CASSETTE_TIMING_SCALE', '1'))